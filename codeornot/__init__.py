@@ -6,6 +6,35 @@
 # @website https://github.com/casics/spiral
 # =============================================================================
 
+from importlib import import_module as _import_module
+
 from .__version__ import *
-from .textcheck import human_language, majority_language
-from .codecheck import code_language, code_filename, noncode_filename
+
+# The modules and public functions are loaded on first access, so that
+# importing the package itself stays cheap.
+_modules = ['textcheck', 'codecheck']
+_functions = {
+    'human_language'    : 'textcheck',
+    'majority_language' : 'textcheck',
+    'code_language'     : 'codecheck',
+    'code_filename'     : 'codecheck',
+    'noncode_filename'  : 'codecheck',
+}
+
+__all__ = list(_functions)
+
+
+def __getattr__(name):
+    if name in _modules:
+        return _import_module('.' + name, __name__)
+    if name not in _functions:
+        raise AttributeError('module {!r} has no attribute {!r}'
+                             .format(__name__, name))
+    module = _import_module('.' + _functions[name], __name__)
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_modules) | set(_functions))
@@ -13,17 +13,24 @@ the function will concatenate them first before performing analysis.
 
 The function `majority_language(list)` will independently analyze a list of
 strings and report the most popular human language used across all the strings.
+
+Results are cached in memory.  If the environment variable CODEORNOT_CACHE_DIR
+is set to a directory path, results are also cached in an SQLite database in
+that directory, so that repeated runs over the same texts can reuse them.  The
+database can be deleted at any time.
 '''
 
-import chardet
-import ftfy
-import locale
+from   collections import Counter, OrderedDict
+from   concurrent.futures import ThreadPoolExecutor
+import hashlib
 import os
-import plac
-import pycld2 as cld2
 import re
+import sqlite3
 import string
-import sys
+import threading
+import types
+
+from .__version__ import __version__
 
 
 # Constants for this module.
@@ -31,6 +38,57 @@ import sys
 
 _min_text_length = 30
 
+# Text beyond this many characters adds nothing to cld2's accuracy, only to
+# the time it takes, so by default longer texts are truncated.
+_max_text_length = 8192
+
+# Maximum number of results remembered by the language cache.  Entries are
+# keyed on a 16-byte digest of the text, so long texts don't pin memory.
+_cache_size = 4096
+
+# Name of the file holding the on-disk cache, if one is requested using the
+# environment variable CODEORNOT_CACHE_DIR.
+_disk_cache_file = 'codeornot-languages.sqlite'
+
+# Version of the detection procedure whose results the on-disk cache holds.
+# Increase this whenever a change alters the answers (e.g., to the script
+# shortcut or to truncation), so that stale caches are discarded.
+_disk_cache_version = 2
+
+# Approximate size in characters of the blocks analyzed by the batched mode
+# of majority_language().
+_batch_length = 4096
+
+# Number of distinct strings above which majority_language() analyzes them
+# in parallel.  cld2 releases the GIL while it works, so threads suffice.
+_parallel_threshold = 32
+
+# ASCII characters that are not in string.printable.  (No character outside
+# of ASCII is in string.printable either.)
+_nonprintable_bytes = bytes(c for c in range(128) if chr(c) not in string.printable)
+
+# Writing systems used by essentially one language each.  Text written
+# overwhelmingly in one of these is assigned the language directly, without
+# running ftfy and cld2.  Scripts shared by several languages (e.g., Latin,
+# Cyrillic, Arabic, Han) are deliberately absent and always go to cld2.
+_script_languages = {
+    'el': '\u0370-\u03ff\u1f00-\u1fff',        # Greek
+    'hy': '\u0530-\u058f',                      # Armenian
+    'th': '\u0e00-\u0e7f',                      # Thai
+    'ka': '\u10a0-\u10ff',                      # Georgian
+    'ja': '\u3040-\u30ff',                      # Hiragana & Katakana
+    'ko': '\u1100-\u11ff\uac00-\ud7af',        # Hangul
+}
+_script_regexps = {lang: re.compile('[' + chars + ']')
+                   for lang, chars in _script_languages.items()}
+_any_script_regexp = re.compile('|'.join('(?P<{}>[{}])'.format(lang, chars)
+                                         for lang, chars in _script_languages.items()))
+
+# Fraction of letters that must belong to one of the scripts above, and the
+# number of characters, sampled evenly across the text, examined to decide.
+_script_fraction = 0.9
+_script_sample_length = 1024
+
 
 # Main functions
 # .............................................................................
@@ -41,7 +99,13 @@ shorter than this length will yield "unknown".'''
     return _min_text_length
 
 
-def human_language(text, enforce_length=False):
+def max_length():
+    '''Return the length at which text is truncated before analysis, unless
+truncation is turned off.'''
+    return _max_text_length
+
+
+def human_language(text, enforce_length=False, truncate=True):
     '''Classify the string in 'text' and return an ISO-639 2-letter language
     code, such as 'en' for English.  If the text cannot be classified or is
     too short to reliably classify, this function will return 'unknown'.  If
@@ -55,37 +119,20 @@ def human_language(text, enforce_length=False):
     if the length is less than a certain minimum, the answer returned will
     always be "unknown".  Use the function `min_length()` to get the value
     of the minimum length threshold.
-    '''
-    def guessed_language(text):
-        reliable, _, details = cld2.detect(text, bestEffort=True)
-        return details[0][1] if details else None
 
-    if not text:
-        return None
-    if isinstance(text, list) and len(text) >= 1:
+    Optional keyword argument 'truncate', if True (the default), will cause
+    only the first `max_length()` characters of the text to be analyzed.
+    Set it to False to analyze the whole text, e.g., when a long document
+    may change language partway through.
+    '''
+    # Plain strings are by far the most common input, so test for them first.
+    if type(text) is not str and isinstance(text, list):
         text = ' '.join(text)
-    if len(text) < _min_text_length:
-        if enforce_length:
-            raise ValueError('Minimum text length for analysis is {} characters'
-                             .format(_min_text_length))
-        else:
-            return 'unknown'
-    try:
-        # Clean up & normalize the text
-        text = ftfy.fix_text(text)
-        try:
-            lang = guessed_language(text)
-        except cld2.error as err:
-            # This is likely a problem with characters that cld2 doesn't
-            # understand.  Apply a sledgehammer and try again.
-            text = ''.join(x for x in text if x in string.printable)
-            lang = guessed_language(text)
-        return lang if lang else "unknown"
-    except Exception as err:
-        return 'unknown'
+    return _human_language_str(text, enforce_length, truncate)
 
 
-def majority_language(string_list, enforce_length=False):
+def majority_language(string_list, enforce_length=False, batch=False,
+                      truncate=True):
     '''Take a list of text strings, evaluate highest-probability language
     off each, and report the most popular of them all.
 
@@ -95,14 +142,46 @@ def majority_language(string_list, enforce_length=False):
     if the length is less than a certain minimum, the answer returned will
     always be "unknown".  Use the function `min_length()` to get the value
     of the minimum length threshold.
+
+    Optional keyword argument 'batch', if True, will cause the strings to be
+    concatenated into blocks of a few thousand characters, each of which is
+    analyzed with a single call to cld2; the answer is then the language
+    with the most text across all the blocks, rather than the language of
+    the most strings.  This is much faster for long lists of short strings.
+    Blocks shorter than `min_length()` are ignored, as in the default mode,
+    so if no block is long enough the answer will be "unknown".  The
+    argument is ignored if 'enforce_length' is True.
+
+    Optional keyword argument 'truncate' has the same meaning as for
+    `human_language()`, and applies to each string separately, including
+    in batch mode.
     '''
     if not isinstance(string_list, list):
         string_list = [string_list]
-    langs = [human_language(string, enforce_length) for string in string_list]
-    # Ignore unknown ones.
-    langs = [lang for lang in langs if lang not in ['un', 'unknown']]
-    if langs:
-        return max(set(langs), key=langs.count)
+    if batch and not enforce_length:
+        return _batched_majority_language(string_list, truncate)
+    if not enforce_length:
+        # Strings too short to analyze can only come back as "unknown".
+        string_list = [text for text in string_list if text and
+                       (not isinstance(text, str) or len(text) >= _min_text_length)]
+    # Identical strings (e.g., boilerplate headers) only need analyzing once.
+    texts = Counter(' '.join(text) if isinstance(text, list) else text
+                    for text in string_list)
+    def analyze(text):
+        return _human_language_str(text, enforce_length, truncate)
+    workers = os.cpu_count() or 1
+    if workers > 1 and len(texts) > _parallel_threshold:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            langs = list(executor.map(analyze, texts))
+    else:
+        langs = map(analyze, texts)
+    votes = Counter()
+    for count, lang in zip(texts.values(), langs):
+        # Ignore unknown ones.
+        if lang and lang not in ('un', 'unknown'):
+            votes[lang] += count
+    if votes:
+        return votes.most_common(1)[0][0]
     else:
         return 'unknown'
 
@@ -118,7 +197,7 @@ def majority_language(string_list, enforce_length=False):
 # way.  I gave up and created a simple substitute for translating two-letter
 # language codes into language names.
 #
-_language_codes = {
+_language_codes = types.MappingProxyType({
     'aa': 'Afar',
     'ab': 'Abkhazian',
     'ae': 'Avestan',
@@ -303,10 +382,225 @@ _language_codes = {
     'za': 'Zhuang',
     'zh': 'Chinese',
     'zu': 'Zulu'
-}
+})
 
 def iso639_to_name(code):
-    if code in _language_codes:
-        return _language_codes[code]
-    else:
+    name = _language_codes.get(code)
+    if name is None:
         raise ValueError('Unknown language code "{}"'.format(code))
+    return name
+
+
+# Internal utilities
+# .............................................................................
+
+def _human_language_str(text, enforce_length, truncate):
+    if not text:
+        return None
+    if len(text) < _min_text_length:
+        if enforce_length:
+            raise ValueError('Minimum text length for analysis is {} characters'
+                             .format(_min_text_length))
+        else:
+            return 'unknown'
+    if truncate and len(text) > _max_text_length:
+        text = text[:_max_text_length]
+    if not isinstance(text, str):
+        # ftfy and cld2 can't make sense of anything else (e.g., bytes).
+        return 'unknown'
+    key = _text_digest(text)
+    with _lang_cache_lock:
+        lang = _lang_cache.get(key)
+        if lang is not None:
+            _lang_cache.move_to_end(key)
+    if lang is None:
+        lang = _disk_cache_get(key)
+        if lang is None:
+            lang = _detect_language(text)
+            _disk_cache_put(key, lang)
+        with _lang_cache_lock:
+            _lang_cache[key] = lang
+            if len(_lang_cache) > _cache_size:
+                _lang_cache.popitem(last=False)
+    return lang
+
+
+_lang_cache = OrderedDict()
+_lang_cache_lock = threading.Lock()
+
+_ftfy = None
+_cld2 = None
+
+# None means not opened yet; False means no disk cache was requested.
+_disk_cache = None
+_disk_cache_lock = threading.Lock()
+
+
+def _disk_cache_connection():
+    global _disk_cache
+    if _disk_cache is None:
+        cache_dir = os.environ.get('CODEORNOT_CACHE_DIR')
+        if not cache_dir:
+            _disk_cache = False
+            return None
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            db = sqlite3.connect(os.path.join(cache_dir, _disk_cache_file),
+                                 check_same_thread=False, isolation_level=None)
+            # The cache is disposable, so trade durability for speed.
+            db.execute('PRAGMA synchronous=OFF')
+            db.execute('PRAGMA journal_mode=MEMORY')
+            # Results are only valid for the code and libraries that made them.
+            db.execute('CREATE TABLE IF NOT EXISTS meta'
+                       ' (key TEXT PRIMARY KEY, value TEXT)')
+            row = db.execute("SELECT value FROM meta WHERE key = 'version'"
+                             ).fetchone()
+            tag = _disk_cache_tag()
+            if not row or row[0] != tag:
+                db.execute('DROP TABLE IF EXISTS lang')
+                db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)",
+                           (tag,))
+            db.execute('CREATE TABLE IF NOT EXISTS lang'
+                       ' (hash BLOB PRIMARY KEY, lang TEXT)')
+            _disk_cache = db
+        except (OSError, sqlite3.Error) as err:
+            _disk_cache = False
+    return _disk_cache or None
+
+
+def _disk_cache_tag():
+    ftfy, cld2 = _libraries()
+    return 'codeornot {} cache {} ftfy {} pycld2 {}'.format(
+        __version__, _disk_cache_version,
+        getattr(ftfy, '__version__', 'unknown'),
+        getattr(cld2, '__version__', 'unknown'))
+
+
+def _disk_cache_get(key):
+    with _disk_cache_lock:
+        db = _disk_cache_connection()
+        if not db:
+            return None
+        try:
+            row = db.execute('SELECT lang FROM lang WHERE hash = ?',
+                             (key,)).fetchone()
+        except sqlite3.Error as err:
+            return None
+    return row[0] if row else None
+
+
+def _disk_cache_put(key, lang):
+    with _disk_cache_lock:
+        db = _disk_cache_connection()
+        if not db:
+            return
+        try:
+            db.execute('INSERT OR IGNORE INTO lang VALUES (?, ?)', (key, lang))
+        except sqlite3.Error as err:
+            pass
+
+
+def _text_digest(text):
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'),
+                           digest_size=16).digest()
+
+
+def _libraries():
+    # ftfy and pycld2 take a while to load, and many users of this package
+    # never need them, so they are only imported on first use.
+    global _ftfy, _cld2
+    if _cld2 is None:
+        import ftfy
+        import pycld2
+        _ftfy = ftfy
+        _cld2 = pycld2
+    return _ftfy, _cld2
+
+
+def _language_details(text):
+    ftfy, cld2 = _libraries()
+    # Clean up & normalize the text.  Pure ASCII text has nothing for ftfy
+    # to repair, and it's by far the most common case.
+    if not text.isascii():
+        text = ftfy.fix_text(text)
+    # cld2.detect returns (is_reliable, bytes_found, details); only the
+    # details (name, code, percent, score) for the top languages are needed.
+    try:
+        return cld2.detect(text, bestEffort=True)[2]
+    except cld2.error as err:
+        # This is likely a problem with characters that cld2 doesn't
+        # understand.  Apply a sledgehammer and try again.
+        text = (text.encode('ascii', 'ignore')
+                .translate(None, _nonprintable_bytes).decode('ascii'))
+        return cld2.detect(text, bestEffort=True)[2]
+
+
+def _detect_language(text):
+    lang = _script_language(text)
+    if lang:
+        return lang
+    try:
+        details = _language_details(text)
+        lang = details[0][1] if details else None
+        return lang if lang else "unknown"
+    except Exception as err:
+        return 'unknown'
+
+
+def _script_language(text):
+    if text.isascii():
+        return None
+    # Sample across all of the text being analyzed, not just its start, so
+    # that e.g. a long English document with a Greek abstract goes to cld2.
+    sample = text[::max(1, len(text) // _script_sample_length)]
+    match = _any_script_regexp.search(sample)
+    if not match:
+        return None
+    lang = match.lastgroup
+    in_script = sum(1 for char in _script_regexps[lang].findall(sample)
+                    if char.isalpha())
+    letters = sum(1 for _ in filter(str.isalpha, sample))
+    return lang if in_script >= _script_fraction * letters else None
+
+
+def _batched_majority_language(string_list, truncate):
+    # cld2 reports up to 3 languages per text along with the percentage of
+    # the text in each, so weight each by the amount of text it covers.
+    votes = Counter()
+    for block in _text_blocks(string_list, _batch_length, truncate):
+        if len(block) < _min_text_length:
+            continue
+        try:
+            details = _language_details(block)
+        except Exception as err:
+            continue
+        for _, lang, percent, _ in details:
+            if lang not in ['un', 'unknown']:
+                votes[lang] += percent * len(block)
+    if votes:
+        return votes.most_common(1)[0][0]
+    else:
+        return 'unknown'
+
+
+def _text_blocks(string_list, length, truncate):
+    block = []
+    size = 0
+    for text in string_list:
+        if not text:
+            continue
+        if isinstance(text, list):
+            text = ' '.join(text)
+        if not isinstance(text, str):
+            # Same as _human_language_str: anything else can't be analyzed.
+            continue
+        if truncate and len(text) > _max_text_length:
+            text = text[:_max_text_length]
+        block.append(text)
+        size += len(text) + 1
+        if size >= length:
+            yield ' '.join(block)
+            block = []
+            size = 0
+    if block:
+        yield ' '.join(block)
@@ -10,24 +10,29 @@
 import os
 from   setuptools import setup, find_packages
 import sys
-import codeornot
 
 here = os.path.abspath(os.path.dirname(__file__))
 
+# Read the version info directly, to avoid importing the package here.
+version = {}
+with open(os.path.join(here, 'codeornot', '__version__.py')) as f:
+    exec(f.read(), version)
+
 with open(os.path.join(here, 'requirements.txt')) as f:
     reqs = f.read().rstrip().splitlines()
 
 setup(
-    name=codeornot.__version__.__title__.lower(),
-    description=codeornot.__version__.__description__,
+    name=version['__title__'].lower(),
+    description=version['__description__'],
     long_description='CodeOrNot implements heuristic methods for determining the type of file or repository content.',
     keywords="program-analysis text-processing machine-learning",
-    version=codeornot.__version__.__version__,
-    url=codeornot.__version__.__url__,
-    author=codeornot.__version__.__author__,
-    author_email=codeornot.__version__.__email__,
-    license=codeornot.__version__.__license__,
+    version=version['__version__'],
+    url=version['__url__'],
+    author=version['__author__'],
+    author_email=version['__email__'],
+    license=version['__license__'],
     packages=['codeornot'],
     install_requires=reqs,
+    python_requires='>=3.7',
     platforms='any',
 )